@@ -1,27 +1,168 @@
+# monkey-patching musí proběhnout před všemi ostatními importy, jinak pool
+# i hub skončí s nepatchovanými zámky a jeden čekající greenlet zmrazí server
+if __name__ == '__main__':
+    from gevent import monkey
+    monkey.patch_all()
+
+import atexit
+import hashlib
+import hmac
 import os
-from flask import Flask, render_template, redirect, url_for, request, flash, session, g
+import queue
+import threading
+import time
+import jinja2
+import orjson
+from flask import Flask, render_template, redirect, url_for, request, flash, session, g, make_response
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SecureCookieSessionInterface
+from flask_caching import Cache
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user, UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
 import sqlite3
 from datetime import datetime
-import pytz
+from zoneinfo import ZoneInfo
 
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 DB_PATH = os.path.join(BASE_DIR, 'data.db')
 
+PRAGUE_TZ = ZoneInfo('Europe/Prague')
 
-def get_db():
-    conn = sqlite3.connect(DB_PATH)
+POOL_SIZE = 8
+
+# heslo do admin sekce jako SHA-256 digest – porovnává se v konstantním čase
+_ADMIN_ACCESS_HASH = hashlib.sha256(os.environ.get('ADMIN_ACCESS_PW', 'admin123').encode()).digest()
+
+# cena PBKDF2 laditelná per host – default míří na ~50 ms na běžném CPU
+PW_ITER = int(os.environ.get('PW_ITER', '120000'))
+PW_HASH_METHOD = 'pbkdf2:sha256:%d' % PW_ITER
+
+
+def _new_connection():
+    # cached_statements navýšeno, aby LRU připravených statementů
+    # pokrylo všechny dotazy v tomto souboru
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False, isolation_level=None,
+                           cached_statements=256)
     conn.row_factory = sqlite3.Row
+    conn.executescript("""
+    PRAGMA journal_mode=WAL;
+    PRAGMA synchronous=NORMAL;
+    PRAGMA temp_store=MEMORY;
+    PRAGMA cache_size=-20000;
+    PRAGMA foreign_keys=ON;
+    """)
     return conn
 
 
-def init_db():
+# pool předem otevřených spojení – nové spojení pro každý request je zbytečně drahé
+_POOL = queue.LifoQueue(maxsize=POOL_SIZE)
+for _ in range(POOL_SIZE):
+    _POOL.put(_new_connection())
+
+
+def get_db():
+    try:
+        return _POOL.get_nowait()
+    except queue.Empty:
+        # pool vyčerpán – otevřít overflow spojení místo blokování; request
+        # už drží g.db, takže čekání na druhé spojení (load_user) by se
+        # při POOL_SIZE souběžných requestech zacyklilo
+        return _new_connection()
+
+
+def put_db(conn):
+    # no-op bez otevřené transakce; po výjimce mezi BEGIN a COMMIT nesmí
+    # do poolu zpět spojení s visícím write zámkem
+    conn.rollback()
+    try:
+        _POOL.put_nowait(conn)
+    except queue.Full:
+        conn.close()
+
+
+@atexit.register
+def _close_pool():
+    while True:
+        try:
+            _POOL.get_nowait().close()
+        except queue.Empty:
+            break
+
+
+# cache úspěšných ověření hesla – opakované přihlášení během TTL
+# nemusí znovu platit plný PBKDF2
+PW_CACHE_TTL = 60
+PW_CACHE_MAX = 1024
+_pw_cache = {}
+_pw_cache_lock = threading.Lock()
+
+
+def verify_password(email, password, stored_hash):
+    # lazy import – werkzeug.security netíží cold start, sys.modules to cachuje
+    from werkzeug.security import check_password_hash
+
+    key = (email, hashlib.sha256(password.encode()).digest())
+    now = time.monotonic()
+    with _pw_cache_lock:
+        hit = _pw_cache.get(key)
+        if hit is not None:
+            cached_hash, ts = hit
+            if now - ts < PW_CACHE_TTL and hmac.compare_digest(cached_hash, stored_hash):
+                return True
+            del _pw_cache[key]
+    if not check_password_hash(stored_hash, password):
+        return False
+    with _pw_cache_lock:
+        if len(_pw_cache) >= PW_CACHE_MAX:
+            _pw_cache.clear()
+        _pw_cache[key] = (stored_hash, now)
+    return True
+
+
+class _OrjsonTaggedSerializer(TaggedJSONSerializer):
+    # tagování (tuples, Markup, datetime) nechává Flasku,
+    # jen samotný JSON jede přes orjson
+    def dumps(self, value):
+        return orjson.dumps(self.tag(value)).decode()
+
+    def loads(self, value):
+        return self._untag_scan(orjson.loads(value))
+
+    def _untag_scan(self, value):
+        # orjson nemá object_hook, tagy je potřeba rozbalit rekurzivně
+        if isinstance(value, dict):
+            return self.untag({k: self._untag_scan(v) for k, v in value.items()})
+        if isinstance(value, list):
+            return [self._untag_scan(v) for v in value]
+        return value
+
+
+class FastSessionInterface(SecureCookieSessionInterface):
+    serializer = _OrjsonTaggedSerializer()
+
+
+cache = Cache(config={'CACHE_TYPE': 'SimpleCache'})
+
+SQL_SHIFTS_VERSION = 'SELECT version FROM shift_list_version WHERE id=1'
+SQL_BUMP_SHIFTS_VERSION = 'UPDATE shift_list_version SET version = version + 1 WHERE id=1'
+
+
+def _shifts_etag(cur):
+    return str(cur.execute(SQL_SHIFTS_VERSION).fetchone()[0])
+
+
+@cache.memoize(timeout=15)
+def _compute_dashboard(user_id):
+    # klíčováno na user_id (ne na current_user), aby byl memoize klíč stabilní
     conn = get_db()
     cur = conn.cursor()
+    cur.execute(SQL_DASHBOARD, (user_id,))
+    row = cur.fetchone()
+    put_db(conn)
+    return dict(row) if row else None
 
-    # pokud DB neexistuje, vytvoří se nová
-    cur.executescript("""
+
+# pokud DB neexistuje, vytvoří se nová
+SCHEMA = """
     CREATE TABLE IF NOT EXISTS user (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         email TEXT UNIQUE,
@@ -40,7 +181,7 @@ def init_db():
         shift_id INTEGER,
         position INTEGER,
         description TEXT,
-        FOREIGN KEY(shift_id) REFERENCES shift(id)
+        FOREIGN KEY(shift_id) REFERENCES shift(id) ON DELETE CASCADE
     );
     CREATE TABLE IF NOT EXISTS progress (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -50,8 +191,8 @@ def init_db():
         completed INTEGER DEFAULT 0,
         timestamp TEXT,
         FOREIGN KEY(user_id) REFERENCES user(id),
-        FOREIGN KEY(shift_id) REFERENCES shift(id),
-        FOREIGN KEY(step_id) REFERENCES shift_step(id)
+        FOREIGN KEY(shift_id) REFERENCES shift(id) ON DELETE CASCADE,
+        FOREIGN KEY(step_id) REFERENCES shift_step(id) ON DELETE CASCADE
     );
     CREATE TABLE IF NOT EXISTS note (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -59,28 +200,177 @@ def init_db():
         user_id INTEGER,
         content TEXT,
         timestamp TEXT,
-        FOREIGN KEY(shift_id) REFERENCES shift(id),
+        FOREIGN KEY(shift_id) REFERENCES shift(id) ON DELETE CASCADE,
         FOREIGN KEY(user_id) REFERENCES user(id)
     );
+    -- materializovaný stav rozpracovaných směn, udržovaný triggery na progress;
+    -- dashboard pak místo agregace dělá jediný indexovaný lookup
+    CREATE TABLE IF NOT EXISTS shift_progress_state (
+        user_id INTEGER,
+        shift_id INTEGER,
+        open_steps INTEGER DEFAULT 0,
+        last_ts TEXT,
+        PRIMARY KEY(user_id, shift_id)
+    );
+    CREATE TRIGGER IF NOT EXISTS trg_progress_ins AFTER INSERT ON progress
+    BEGIN
+        INSERT INTO shift_progress_state (user_id, shift_id, open_steps, last_ts)
+        VALUES (NEW.user_id, NEW.shift_id, NEW.completed=0, NEW.timestamp)
+        ON CONFLICT(user_id, shift_id) DO UPDATE SET
+            open_steps = open_steps + (NEW.completed=0),
+            last_ts = NEW.timestamp;
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_progress_upd AFTER UPDATE OF completed ON progress
+    WHEN NEW.completed != OLD.completed
+    BEGIN
+        UPDATE shift_progress_state
+        SET open_steps = open_steps + CASE WHEN NEW.completed=0 THEN 1 ELSE -1 END,
+            last_ts = NEW.timestamp
+        WHERE user_id = NEW.user_id AND shift_id = NEW.shift_id;
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_progress_del AFTER DELETE ON progress
+    BEGIN
+        UPDATE shift_progress_state
+        SET open_steps = open_steps - (OLD.completed=0)
+        WHERE user_id = OLD.user_id AND shift_id = OLD.shift_id;
+    END;
+    CREATE INDEX IF NOT EXISTS ix_progress_user_shift ON progress(user_id, shift_id);
+    CREATE INDEX IF NOT EXISTS ix_progress_user_ts ON progress(user_id, timestamp DESC);
+    CREATE INDEX IF NOT EXISTS ix_step_shift_pos ON shift_step(shift_id, position);
+    CREATE INDEX IF NOT EXISTS ix_note_shift_ts ON note(shift_id, timestamp DESC);
+    CREATE UNIQUE INDEX IF NOT EXISTS ux_progress_triple ON progress(user_id, shift_id, step_id);
+    -- sdílená verze seznamu směn pro ETagy; per-proces čítač by se mezi
+    -- gunicorn workery rozjel a klienti by dostávali 304 na zastaralý obsah
+    CREATE TABLE IF NOT EXISTS shift_list_version (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL
+    );
+    INSERT OR IGNORE INTO shift_list_version (id, version) VALUES (1, 0);
+"""
+
+
+# SQL horkých cest jako modulové konstanty – stejný PyObject při každém
+# volání, takže statement cache sqlite3 trefuje bez přehashování
+SQL_USER_BY_ID = 'SELECT * FROM user WHERE id=?'
+SQL_USER_BY_EMAIL = 'SELECT * FROM user WHERE email=?'
+SQL_DASHBOARD = '''
+    SELECT s.*
+    FROM shift s
+    JOIN shift_progress_state st ON st.shift_id = s.id
+    WHERE st.user_id=? AND st.open_steps > 0
+    ORDER BY st.last_ts DESC
+    LIMIT 1
+'''
+SQL_SHIFT_DETAIL = '''
+    SELECT s.id AS sid, s.title, s.description,
+           st.id AS step_id, st.position, st.description AS step_desc,
+           p.completed, p.timestamp
+    FROM shift s
+    LEFT JOIN shift_step st ON st.shift_id = s.id
+    LEFT JOIN progress p ON p.step_id = st.id AND p.shift_id = s.id AND p.user_id=?
+    WHERE s.id=?
+    ORDER BY st.position
+'''
+SQL_NOTES_BY_SHIFT = '''
+    SELECT n.*, u.name AS user_name
+    FROM note n
+    JOIN user u ON n.user_id = u.id
+    WHERE n.shift_id=?
+    ORDER BY n.timestamp DESC
+'''
+SQL_INSERT_PROGRESS = 'INSERT INTO progress (user_id, shift_id, step_id, completed, timestamp) VALUES (?,?,?,0,?)'
+SQL_TOGGLE = ('UPDATE progress SET completed = 1 - completed, timestamp=? '
+              'WHERE user_id=? AND shift_id=? AND step_id=? RETURNING completed')
+SQL_INSERT_NOTE = 'INSERT INTO note (shift_id, user_id, content, timestamp) VALUES (?,?,?,?)'
+SQL_INSERT_STEP = 'INSERT INTO shift_step (shift_id, position, description) VALUES (?,?,?)'
+
+
+def _migrate_cascade(cur):
+    # starší DB mají child tabulky bez ON DELETE CASCADE – je nutné je přestavět
+    row = cur.execute(
+        "SELECT sql FROM sqlite_master WHERE type='table' AND name='shift_step'"
+    ).fetchone()
+    if row is None or 'ON DELETE CASCADE' in row['sql']:
+        return
+    # celá přestavba v jediné transakci – pád uprostřed ji odrolluje a další
+    # start ji zopakuje; po částečném commitu by data zůstala viset
+    # v _old_* tabulkách, zatímco aplikace by servírovala prázdné schéma.
+    # Triggery a indexy zůstávají po RENAME viset na starých tabulkách,
+    # explicitní DROP uvolní jména pro nové schéma. Osiřelé řádky (kroky
+    # smazané starým edit_shift) se nepřenáší – nové FK by je stejně
+    # odmítly a jen nafukovaly open_steps.
+    cur.executescript("""
+    BEGIN;
+    ALTER TABLE shift_step RENAME TO _old_shift_step;
+    ALTER TABLE progress RENAME TO _old_progress;
+    ALTER TABLE note RENAME TO _old_note;
+    DROP TRIGGER IF EXISTS trg_progress_ins;
+    DROP TRIGGER IF EXISTS trg_progress_upd;
+    DROP TRIGGER IF EXISTS trg_progress_del;
+    DROP INDEX IF EXISTS ix_progress_user_shift;
+    DROP INDEX IF EXISTS ix_progress_user_ts;
+    DROP INDEX IF EXISTS ix_step_shift_pos;
+    DROP INDEX IF EXISTS ix_note_shift_ts;
+    DROP INDEX IF EXISTS ux_progress_triple;
+    """ + SCHEMA + """
+    INSERT INTO shift_step SELECT * FROM _old_shift_step
+        WHERE shift_id IN (SELECT id FROM shift);
+    INSERT INTO progress SELECT * FROM _old_progress
+        WHERE step_id IN (SELECT id FROM shift_step)
+          AND shift_id IN (SELECT id FROM shift)
+          AND user_id IN (SELECT id FROM user);
+    INSERT INTO note SELECT * FROM _old_note
+        WHERE shift_id IN (SELECT id FROM shift)
+          AND user_id IN (SELECT id FROM user);
+    DROP TABLE _old_progress;
+    DROP TABLE _old_note;
+    DROP TABLE _old_shift_step;
+    COMMIT;
     """)
 
+
+def init_db():
+    from werkzeug.security import generate_password_hash
+
+    conn = get_db()
+    cur = conn.cursor()
+
+    cur.executescript(SCHEMA)
+    _migrate_cascade(cur)
+
+    # přepočet stavu z progress – srovná DB vytvořené před zavedením triggerů
+    # i skupiny, jejichž řádky odfiltrovala migrace; atomicky, protože
+    # init_db() běží při startu v každém workeru souběžně
+    cur.execute('BEGIN IMMEDIATE')
+    cur.execute('DELETE FROM shift_progress_state')
+    cur.execute('''
+        INSERT INTO shift_progress_state (user_id, shift_id, open_steps, last_ts)
+        SELECT user_id, shift_id, SUM(completed=0), MAX(timestamp)
+        FROM progress
+        GROUP BY user_id, shift_id
+    ''')
+    cur.execute('COMMIT')
+
     # vytvoření admin účtu, pokud neexistuje
     cur.execute("SELECT id FROM user WHERE email=?", ('admin@example.com',))
     if not cur.fetchone():
         cur.execute(
             "INSERT INTO user (email, name, password, is_admin) VALUES (?,?,?,1)",
-            ('admin@example.com', 'Admin', generate_password_hash('admin123'))
+            ('admin@example.com', 'Admin', generate_password_hash('admin123', method=PW_HASH_METHOD))
         )
     conn.commit()
-    conn.close()
+    put_db(conn)
 
 
 def create_app():
     app = Flask(__name__)
     app.secret_key = os.environ.get('SECRET_KEY', 'dev-secret-key')
+    app.session_interface = FastSessionInterface()
     login = LoginManager()
     login.init_app(app)
     login.login_view = 'login'
+    cache.init_app(app)
+    app.jinja_env.bytecode_cache = jinja2.FileSystemBytecodeCache()
 
     init_db()
 
@@ -95,9 +385,9 @@ def create_app():
     def load_user(user_id):
         conn = get_db()
         cur = conn.cursor()
-        cur.execute('SELECT * FROM user WHERE id=?', (int(user_id),))
+        cur.execute(SQL_USER_BY_ID, (int(user_id),))
         row = cur.fetchone()
-        conn.close()
+        put_db(conn)
         return User(row) if row else None
 
     @app.before_request
@@ -108,7 +398,7 @@ def create_app():
     def teardown_request(exc):
         db = getattr(g, 'db', None)
         if db is not None:
-            db.close()
+            put_db(db)
 
     @app.route('/')
     def index():
@@ -119,10 +409,12 @@ def create_app():
     @app.route('/register', methods=['GET', 'POST'])
     def register():
         if request.method == 'POST':
+            from werkzeug.security import generate_password_hash
+
             email = request.form['email'].strip().lower()
             name = request.form['name'].strip()
             password = request.form['password']
-            hashed = generate_password_hash(password, method='pbkdf2:sha256')
+            hashed = generate_password_hash(password, method=PW_HASH_METHOD)
             try:
                 cur = g.db.cursor()
                 cur.execute('INSERT INTO user (email,name,password,is_admin) VALUES (?,?,?,0)', (email, name, hashed))
@@ -139,9 +431,15 @@ def create_app():
             email = request.form['email'].strip().lower()
             password = request.form['password']
             cur = g.db.cursor()
-            cur.execute('SELECT * FROM user WHERE email=?', (email,))
+            cur.execute(SQL_USER_BY_EMAIL, (email,))
             row = cur.fetchone()
-            if row and check_password_hash(row['password'], password):
+            if row and verify_password(email, password, row['password']):
+                # starší účty průběžně převést na aktuální počet iterací
+                if not row['password'].startswith(PW_HASH_METHOD + '$'):
+                    from werkzeug.security import generate_password_hash
+                    cur.execute('UPDATE user SET password=? WHERE id=?',
+                                (generate_password_hash(password, method=PW_HASH_METHOD), row['id']))
+                    g.db.commit()
                 login_user(User(row))
                 flash('Přihlášení úspěšné', 'success')
                 return redirect(url_for('dashboard'))
@@ -151,22 +449,10 @@ def create_app():
     @app.route('/dashboard')
     @login_required
     def dashboard():
-        cur = g.db.cursor()
-        cur.execute('''
-            SELECT s.*
-            FROM shift s
-            JOIN progress p ON s.id = p.shift_id
-            WHERE p.user_id=?
-            GROUP BY s.id
-            HAVING SUM(p.completed) < COUNT(p.id)
-            ORDER BY MAX(p.timestamp) DESC
-            LIMIT 1
-        ''', (current_user.id,))
-        current_shift = cur.fetchone()
-        prague_tz = pytz.timezone('Europe/Prague')
-    now = datetime.now(prague_tz)
-    current_time = now.strftime("%H:%M:%S")
-    current_date = now.strftime("%A, %d. %B %Y")
+        current_shift = _compute_dashboard(current_user.id)
+        now = datetime.now(PRAGUE_TZ)
+        current_time = now.strftime("%H:%M:%S")
+        current_date = now.strftime("%A, %d. %B %Y")
         return render_template('dashboard.html', current_shift=current_shift, current_time=current_time, current_date=current_date)
 
     @app.route('/logout')
@@ -180,80 +466,87 @@ def create_app():
     @login_required
     def shifts():
         cur = g.db.cursor()
+        etag = _shifts_etag(cur)
+        # 304 jen pokud nečekají flash zprávy – ty se spotřebují až při renderu
+        had_flashes = bool(session.get('_flashes'))
+        if not had_flashes and etag in request.if_none_match:
+            return '', 304
         cur.execute('SELECT * FROM shift')
         shifts = cur.fetchall()
-        return render_template('shifts.html', shifts=shifts)
+        resp = make_response(render_template('shifts.html', shifts=shifts))
+        # render s flashkami se nesmí stát validátorem – 304 by banner opakoval
+        if not had_flashes:
+            resp.set_etag(etag)
+        return resp
 
     @app.route('/shift/<int:shift_id>', methods=['GET', 'POST'])
     @login_required
     def shift_detail(shift_id):
         cur = g.db.cursor()
-        cur.execute('SELECT * FROM shift WHERE id=?', (shift_id,))
-        shift = cur.fetchone()
-        if not shift:
+        # holé tuples – hot dotaz nemusí platit sqlite3.Row wrapper za řádek
+        cur.row_factory = None
+        # směna + kroky + progress jedním dotazem místo tří
+        cur.execute(SQL_SHIFT_DETAIL, (current_user.id, shift_id))
+        rows = cur.fetchall()
+        if not rows:
             flash('Směna nenalezena', 'danger')
             return redirect(url_for('shifts'))
 
-        cur.execute('SELECT * FROM shift_step WHERE shift_id=? ORDER BY position', (shift_id,))
-        steps = cur.fetchall()
+        shift = {'id': rows[0][0], 'title': rows[0][1], 'description': rows[0][2]}
+        steps = []
+        progress = {}
+        for _sid, _title, _desc, step_id, position, step_desc, completed, timestamp in rows:
+            if step_id is None:
+                continue
+            steps.append({'id': step_id, 'position': position, 'description': step_desc})
+            if completed is not None:
+                progress[step_id] = (completed, timestamp)
 
         if request.method == 'POST':
             action = request.form.get('action')
+            # jeden timestamp pro celý POST – netřeba formátovat pro každý řádek
+            ts = datetime.utcnow().isoformat()
 
             if action == 'select_shift':
+                cur.execute('BEGIN IMMEDIATE')
                 cur.execute('DELETE FROM progress WHERE user_id=? AND shift_id=?', (current_user.id, shift_id))
-                for s in steps:
-                    cur.execute(
-                        'INSERT INTO progress (user_id, shift_id, step_id, completed, timestamp) VALUES (?,?,?,?,?)',
-                        (current_user.id, shift_id, s['id'], 0, datetime.utcnow().isoformat())
-                    )
-                g.db.commit()
+                cur.executemany(SQL_INSERT_PROGRESS,
+                                [(current_user.id, shift_id, s['id'], ts) for s in steps])
+                cur.execute('COMMIT')
+                cache.delete_memoized(_compute_dashboard, current_user.id)
                 flash('Směna vybrána – hodně štěstí!', 'success')
                 return redirect(url_for('shift_detail', shift_id=shift_id))
 
             elif action and action.startswith('toggle_'):
                 step_id = int(action.split('_', 1)[1])
-                cur.execute('SELECT completed FROM progress WHERE user_id=? AND shift_id=? AND step_id=?',
-                            (current_user.id, shift_id, step_id))
-                row = cur.fetchone()
-                if row:
-                    newc = 0 if row['completed'] else 1
-                    cur.execute('UPDATE progress SET completed=?, timestamp=? WHERE user_id=? AND shift_id=? AND step_id=?',
-                                (newc, datetime.utcnow().isoformat(), current_user.id, shift_id, step_id))
+                # atomický flip v jednom dotazu místo SELECT + UPDATE
+                cur.execute(SQL_TOGGLE, (ts, current_user.id, shift_id, step_id))
+                if cur.fetchone() is not None:
                     g.db.commit()
+                    cache.delete_memoized(_compute_dashboard, current_user.id)
                 return redirect(url_for('shift_detail', shift_id=shift_id))
 
             elif action == 'complete_shift':
                 cur.execute('DELETE FROM progress WHERE user_id=? AND shift_id=?', (current_user.id, shift_id))
                 g.db.commit()
+                cache.delete_memoized(_compute_dashboard, current_user.id)
                 flash('Směna byla označena jako dokončená.', 'info')
                 return redirect(url_for('dashboard'))
 
             elif action == 'add_note':
                 content = request.form.get('note_content', '').strip()
                 if content:
-                    cur.execute(
-                        'INSERT INTO note (shift_id, user_id, content, timestamp) VALUES (?,?,?,?)',
-                        (shift_id, current_user.id, content, datetime.utcnow().isoformat())
-                    )
+                    cur.execute(SQL_INSERT_NOTE, (shift_id, current_user.id, content, ts))
                     g.db.commit()
                     flash('Poznámka přidána.', 'success')
                 else:
                     flash('Poznámka nesmí být prázdná.', 'warning')
                 return redirect(url_for('shift_detail', shift_id=shift_id))
 
-        cur.execute('SELECT * FROM progress WHERE user_id=? AND shift_id=?', (current_user.id, shift_id))
-        progress = {p['step_id']: p for p in cur.fetchall()}
-
         # načtení poznámek
-        cur.execute('''
-            SELECT n.*, u.name AS user_name
-            FROM note n
-            JOIN user u ON n.user_id = u.id
-            WHERE n.shift_id=?
-            ORDER BY n.timestamp DESC
-        ''', (shift_id,))
-        notes = cur.fetchall()
+        ncur = g.db.cursor()
+        ncur.execute(SQL_NOTES_BY_SHIFT, (shift_id,))
+        notes = ncur.fetchall()
 
         return render_template('shift_detail.html', shift=shift, steps=steps, progress=progress, notes=notes)
 
@@ -267,22 +560,28 @@ def create_app():
         if request.method == 'POST':
             title = request.form['title']
             description = request.form.get('description', '')
-            steps = request.form.get('steps', '').split('\n')
+            # normalizace v jednom průchodu; splitlines() nenechává prázdný ocas
+            lines = [s for s in (t.strip() for t in request.form.get('steps', '').splitlines()) if s]
+            cur.execute('BEGIN IMMEDIATE')
             cur.execute('INSERT INTO shift (title, description, is_template) VALUES (?,?,1)', (title, description))
             shift_id = cur.lastrowid
-            pos = 1
-            for s in steps:
-                s = s.strip()
-                if s:
-                    cur.execute('INSERT INTO shift_step (shift_id, position, description) VALUES (?,?,?)', (shift_id, pos, s))
-                    pos += 1
-            g.db.commit()
+            cur.executemany(SQL_INSERT_STEP,
+                            [(shift_id, pos, s) for pos, s in enumerate(lines, 1)])
+            cur.execute(SQL_BUMP_SHIFTS_VERSION)
+            cur.execute('COMMIT')
             flash('Směna vytvořena', 'success')
             return redirect(url_for('admin'))
 
+        etag = _shifts_etag(cur)
+        had_flashes = bool(session.get('_flashes'))
+        if not had_flashes and etag in request.if_none_match:
+            return '', 304
         cur.execute('SELECT * FROM shift ORDER BY id DESC')
         shifts = cur.fetchall()
-        return render_template('admin.html', shifts=shifts)
+        resp = make_response(render_template('admin.html', shifts=shifts))
+        if not had_flashes:
+            resp.set_etag(etag)
+        return resp
 
     @app.route('/admin/edit/<int:shift_id>', methods=['GET', 'POST'])
     def edit_shift(shift_id):
@@ -304,17 +603,15 @@ def create_app():
         if request.method == 'POST':
             title = request.form['title']
             description = request.form.get('description', '')
-            steps_input = request.form.get('steps', '').split('\n')
+            lines = [s for s in (t.strip() for t in request.form.get('steps', '').splitlines()) if s]
 
+            cur.execute('BEGIN IMMEDIATE')
             cur.execute('UPDATE shift SET title=?, description=? WHERE id=?', (title, description, shift_id))
             cur.execute('DELETE FROM shift_step WHERE shift_id=?', (shift_id,))
-            pos = 1
-            for s in steps_input:
-                s = s.strip()
-                if s:
-                    cur.execute('INSERT INTO shift_step (shift_id, position, description) VALUES (?,?,?)', (shift_id, pos, s))
-                    pos += 1
-            g.db.commit()
+            cur.executemany(SQL_INSERT_STEP,
+                            [(shift_id, pos, s) for pos, s in enumerate(lines, 1)])
+            cur.execute(SQL_BUMP_SHIFTS_VERSION)
+            cur.execute('COMMIT')
             flash('Směna upravena.', 'success')
             return redirect(url_for('admin'))
 
@@ -326,11 +623,12 @@ def create_app():
             flash('Nemáš oprávnění', 'danger')
             return redirect(url_for('admin_access'))
         cur = g.db.cursor()
-        cur.execute('DELETE FROM progress WHERE shift_id=?', (shift_id,))
-        cur.execute('DELETE FROM shift_step WHERE shift_id=?', (shift_id,))
-        cur.execute('DELETE FROM note WHERE shift_id=?', (shift_id,))
+        # kroky, progress i poznámky odstraní ON DELETE CASCADE uvnitř SQLite
+        cur.execute('BEGIN IMMEDIATE')
+        cur.execute('DELETE FROM shift_progress_state WHERE shift_id=?', (shift_id,))
         cur.execute('DELETE FROM shift WHERE id=?', (shift_id,))
-        g.db.commit()
+        cur.execute(SQL_BUMP_SHIFTS_VERSION)
+        cur.execute('COMMIT')
         flash('Směna a všechny související údaje byly smazány.', 'info')
         return redirect(url_for('admin'))
 
@@ -338,7 +636,7 @@ def create_app():
     def admin_access():
         if request.method == 'POST':
             password = request.form['password']
-            if password == 'admin123':
+            if hmac.compare_digest(hashlib.sha256(password.encode()).digest(), _ADMIN_ACCESS_HASH):
                 session['is_admin_access'] = True
                 flash('Přístup povolen', 'success')
                 return redirect(url_for('admin'))
@@ -350,7 +648,9 @@ def create_app():
 
 app = create_app()
 if __name__ == '__main__':
+    # gevent místo jednovláknového dev serveru – jeden PBKDF2 login
+    # jinak blokuje všechny ostatní requesty
+    from gevent.pywsgi import WSGIServer
     from werkzeug.middleware.proxy_fix import ProxyFix
-    app = create_app()
     app.wsgi_app = ProxyFix(app.wsgi_app)
-    app.run(debug=True)
+    WSGIServer(('0.0.0.0', 5000), app).serve_forever()